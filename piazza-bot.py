@@ -12,14 +12,158 @@ Usage:
 
 import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    # Optional: pip install "httpx[http2]" to multiplex RPCs over HTTP/2
+    import httpx
+    import h2  # noqa: F401 (needed by httpx for http2=True)
+except ImportError:
+    httpx = None
 from piazza_api import Piazza
 from piazza_api.rpc import PiazzaRPC
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 import config as cfg
 import json
+import logging
+import os
+import re
+import sys
+import traceback
+
+log = logging.getLogger(__name__)
+
+# Set PIAZZA_BOT_DEBUG=1 to print raw API responses and stack traces
+DEBUG = os.environ.get("PIAZZA_BOT_DEBUG") == "1"
+
+# Upper bound on concurrent post fetches (keeps us polite to Piazza)
+MAX_CONCURRENT_FETCHES = 6
+
+# Token bucket sizing; we only slow down further when Piazza says "too fast"
+MAX_REQUESTS_PER_SECOND = 5
+MAX_BURST = 10
+MAX_RATE_LIMIT_RETRIES = 5
+MAX_BACKOFF = 30
+
+# Each network.get_updates call is held open for at most this long, and calls
+# are spaced at least LONG_POLL_MIN_INTERVAL apart if Piazza answers right away.
+# After MAX_UNHELD_UPDATES empty answers in a row that came back within
+# LONG_POLL_HELD_THRESHOLD, the channel isn't really long-polling, so we go
+# back to interval polling
+LONG_POLL_TIMEOUT = 30
+LONG_POLL_MIN_INTERVAL = 5
+LONG_POLL_HELD_THRESHOLD = 1
+MAX_UNHELD_UPDATES = 3
+
+# Even when new content wakes the loop early, checks start at least this far apart
+MIN_CHECK_GAP = 15
+
+# Error messages meaning a poll can't (or needn't) be voted on, or that we're going too fast
+# Anchored to Piazza's wording so transport errors like "Remote end closed connection" don't match
+ALREADY_VOTED_RE = re.compile(
+    r"already (voted|answered|responded)|\bvoted\b|poll (is |has been |was )?(closed|expired)|\bexpired\b|not accept",
+    re.I
+)
+RATE_LIMIT_RE = re.compile(r"too fast|too many requests|\bwait\b", re.I)
+
+# Browser-like user agent to avoid detection
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36 Edg/142.0.0.0'
+
+# Headers composed once and pinned on every session we build
+SESSION_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Encoding': 'gzip, deflate',
+}
+
+if httpx is not None:
+    class Http2Session(httpx.Client):
+        """HTTP/2 client that accepts the requests-style string bodies piazza-api sends"""
+        def post(self, url, data=None, **kwargs):
+            if isinstance(data, (str, bytes)):
+                kwargs['content'] = data
+                data = None
+            return super().post(url, data=data, **kwargs)
+
+class TimeoutSession(requests.Session):
+    """requests session that applies `timeout` to every call, like httpx.Client does"""
+    timeout = None
+    
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(*args, **kwargs)
+
+class RateLimited(Exception):
+    """Raised when Piazza answers with HTTP 429"""
+    def __init__(self, retry_after=None):
+        super().__init__("HTTP 429 Too Many Requests")
+        self.retry_after = retry_after
+
+def raise_for_rate_limit(response, *args, **kwargs):
+    """Session response hook turning HTTP 429 into RateLimited, with Retry-After in seconds"""
+    if response.status_code != 429:
+        return
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        try:
+            retry_after = max(0.0, float(retry_after))
+        except ValueError:
+            # Retry-After may also be an HTTP date
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+                retry_after = max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                retry_after = None
+    raise RateLimited(retry_after)
+
+class UpdateChannelError(Exception):
+    """Raised when Piazza answers network.get_updates with an RPC error (e.g. unknown method)"""
+
+TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
+if httpx is not None:
+    TIMEOUT_ERRORS += (httpx.TimeoutException,)
+
+# Network-level failures; their text says nothing about the poll itself
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.TransportError,)
+
+class RateLimiter:
+    """Token bucket shared by every request thread"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until a request may be sent"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+    
+    def back_off(self, delay):
+        """Hold every caller for `delay` seconds after the server pushes back"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            self.tokens = 0
 
 class PiazzaPollBot:
-    def __init__(self, email, password, class_id, poll_answer_index=0, check_interval=60):
+    def __init__(self, email, password, class_id, poll_answer_index=0, check_interval=60,
+                 answered_file="answered_polls.jsonl", seed=None):
         """
         Initialize the Piazza Poll Bot
         
@@ -29,16 +173,31 @@ class PiazzaPollBot:
             class_id: The class ID (e.g., 'jx7ab2cd4ef')
             poll_answer_index: Which option to select (0 = first option, 1 = second, etc.)
             check_interval: How often to check for new polls (in seconds)
+            answered_file: JSON Lines file that remembers answered polls across restarts
+            seed: Optional seed for the random delays (for reproducible runs)
         """
         self.email = email
         self.password = password
         self.class_id = class_id
         self.poll_answer_index = poll_answer_index
         self.check_interval = check_interval
-        self.answered_polls = set()
+        self.answered_file = answered_file
+        self.answered_polls = self._load_answered_polls()
+        self._answered_lock = threading.Lock()
+        self._output_lock = threading.Lock()
+        self.rate_limiter = RateLimiter(MAX_REQUESTS_PER_SECOND, MAX_BURST)
         self.piazza = Piazza()
         self.rpc = None
+        self.updates_rpc = None
         self.network = None
+        self.updates_supported = True
+        self.batch_fetch_supported = True
+        self._timestamp_cache = (0, "")
+        self._rng = random.Random(seed if seed is not None else os.urandom(8))
+        self.last_update_time = int(time.time())
+        self.last_check_started = time.monotonic()
+        self.known_content_ids = set()
+        self.unheld_updates = 0
         
     def login(self):
         """Login to Piazza"""
@@ -48,67 +207,209 @@ class PiazzaPollBot:
             self.piazza.user_login(email=self.email, password=self.password)
             self.network = self.piazza.network(self.class_id)
             
+            # Both sessions below are built from the original login session so they
+            # carry its cookies rather than a copy taken from the other session
+            login_session = self.network._rpc.session
+            
+            # Swap in a pooled keep-alive session so every RPC reuses a warm connection
+            session = self._build_session(login_session)
+            self.network._rpc.session = session
+            
             # Create RPC instance and share the session
             self.rpc = PiazzaRPC(self.class_id)
-            # Share the session cookies between Piazza and RPC
-            self.rpc.session = self.network._rpc.session
+            self.rpc.session = session
             
-            # Set browser-like user agent to avoid detection
-            self.rpc.session.headers.update({
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36 Edg/142.0.0.0'
-            })
+            # Long-polls get their own connection so they never hold up fetches and votes
+            self.updates_rpc = PiazzaRPC(self.class_id)
+            self.updates_rpc.session = self._build_session(login_session)
             
             print(f"[{self._timestamp()}] Successfully logged in!")
             return True
         except Exception as e:
             print(f"[{self._timestamp()}] Login failed: {e}")
-            import traceback
-            traceback.print_exc()
+            log.debug("Stack trace:", exc_info=True)
             return False
     
+    def _load_answered_polls(self):
+        """Load the IDs of polls handled by previous runs"""
+        if not os.path.exists(self.answered_file):
+            return set()
+        answered = set()
+        with open(self.answered_file) as f:
+            lines = f.read().split("\n")
+        for line in lines:
+            try:
+                answered.add(sys.intern(json.loads(line)))
+            except (json.JSONDecodeError, TypeError):
+                # Blank or half-written line (e.g. a crash mid-append); skip it
+                continue
+        
+        # Terminate a half-written last line so the next append starts on its own line
+        if lines[-1]:
+            with open(self.answered_file, 'a') as f:
+                f.write("\n")
+        return answered
+    
+    def _mark_answered(self, post_id):
+        """Remember a poll as handled, appending it to the answered file"""
+        # Stored IDs are interned so has_answered_poll's (also interned) lookups match by identity
+        post_id = sys.intern(post_id)
+        with self._answered_lock:
+            if post_id in self.answered_polls:
+                return
+            self.answered_polls.add(post_id)
+            # Appending one line is cheap and survives crashes without rewriting the file
+            with open(self.answered_file, 'a') as f:
+                f.write(json.dumps(post_id) + "\n")
+    
+    def _build_session(self, logged_in_session):
+        """Create a connection-pooled session carrying over the login cookies"""
+        if httpx is not None:
+            # All concurrent fetches share one multiplexed HTTP/2 connection
+            limits = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            session = Http2Session(
+                transport=httpx.HTTPTransport(http2=True, retries=3, limits=limits),
+                # No 'Connection' header here: it is illegal over HTTP/2
+                headers=SESSION_HEADERS,
+                cookies=logged_in_session.cookies,
+                timeout=30.0,
+                event_hooks={'response': [raise_for_rate_limit]}
+            )
+            return session
+        
+        # Fall back to HTTP/1.1 keep-alive with requests
+        session = TimeoutSession()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,  # Must cover MAX_CONCURRENT_FETCHES
+            # Only safe reads are retried here; piazza-api's RPCs (including content.vote)
+            # are POSTs and go through _rpc_call's rate-limit handling instead
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=frozenset({"GET", "HEAD"})
+            )
+        )
+        session.mount("https://", adapter)
+        session.headers.update(SESSION_HEADERS)
+        session.hooks['response'].append(raise_for_rate_limit)
+        session.cookies = logged_in_session.cookies
+        return session
+    
     def _timestamp(self):
         """Get current timestamp for logging"""
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Log lines come in bursts, so only reformat when the second changes
+        now = int(time.time())
+        cached_second, cached_text = self._timestamp_cache
+        if now != cached_second:
+            cached_text = datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+            self._timestamp_cache = (now, cached_text)
+        return cached_text
     
     def get_all_posts(self):
-        """Retrieve all posts from the class"""
+        """Retrieve the post summaries from the class feed"""
         try:
             # Use the feed endpoint instead of iter_all_posts to avoid rate limiting
             # The feed gives us all posts in one request instead of fetching each individually
-            feed = self.network.get_feed(limit=10, offset=0)
-            post_ids = [post['id'] for post in feed.get('feed', [])]
-            
-            print(f"[{self._timestamp()}] Found {len(post_ids)} posts in feed")
-            
-            # Fetch full details for each post, but with rate limiting protection
-            posts = []
-            for i, post_id in enumerate(post_ids):
-                try:
-                    # Add small delay between requests to avoid "too fast" error
-                    if i >= 0:  # Don't delay before first request
-                        time.sleep(random.uniform(0.7, 0.9))  # 700-900ms between posts
-                    
-                    post = self.network.get_post(post_id)
-                    posts.append(post)
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    if 'too fast' in error_msg or 'wait' in error_msg:
-                        # Hit rate limit, wait longer and retry
-                        print(f"[{self._timestamp()}] Rate limit hit, waiting 2 seconds...")
-                        time.sleep(2)
-                        try:
-                            post = self.network.get_post(post_id)
-                            posts.append(post)
-                        except:
-                            print(f"[{self._timestamp()}] Could not fetch post {post_id} after retry, skipping")
-                    else:
-                        print(f"[{self._timestamp()}] Error fetching post {post_id}: {str(e)[:100]}")
+            feed = self._rpc_call(self.network.get_feed, limit=10, offset=0)
+            posts = feed.get('feed', [])
             
+            print(f"[{self._timestamp()}] Found {len(posts)} posts in feed")
             return posts
         except Exception as e:
             print(f"[{self._timestamp()}] Error fetching posts: {e}")
             return []
     
+    def hydrate_poll(self, post_summary):
+        """Fetch full details for a feed entry (callers pass only unanswered polls)"""
+        return self._fetch_post(post_summary['id'])
+    
+    def hydrate_polls(self, post_summaries):
+        """Fetch full details for several unanswered polls, in one request when Piazza allows it"""
+        if len(post_summaries) > 1 and self.batch_fetch_supported:
+            posts = self._fetch_posts_batch([post['id'] for post in post_summaries])
+            if posts is not None:
+                return posts
+        
+        # Fall back to individual fetches; total time is bounded by the slowest
+        # fetch instead of the sum of every round trip
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as pool:
+            results = pool.map(self.hydrate_poll, post_summaries)
+            return [post for post in results if post is not None]
+    
+    def _fetch_posts_batch(self, post_ids):
+        """Fetch several posts with a single content.get, or None if that didn't work"""
+        try:
+            response = self._rpc_call(
+                self.rpc.request,
+                method="content.get",
+                data={"cids": post_ids}
+            )
+        except Exception as e:
+            # Timeouts, dropped connections, rate limits: fall back for this cycle only
+            self._emit([f"[{self._timestamp()}] Batch fetch failed, fetching polls individually: {str(e)[:100]}"])
+            return None
+        
+        result = response.get('result')
+        if response.get('error') is None and isinstance(result, list):
+            posts = [post for post in result if isinstance(post, dict)]
+            if {post.get('id') for post in posts} == set(post_ids):
+                return posts
+        
+        # Piazza answered, but with an error or a shape that isn't a list of the posts we asked for
+        self._emit([f"[{self._timestamp()}] Batch fetch not supported, fetching polls individually"])
+        self.batch_fetch_supported = False
+        return None
+    
+    def _fetch_post(self, post_id):
+        """Fetch a single post, returning None if it can't be retrieved"""
+        try:
+            return self._rpc_call(self.network.get_post, post_id)
+        except Exception as e:
+            self._emit([f"[{self._timestamp()}] Error fetching post {post_id}: {str(e)[:100]}"])
+            return None
+    
+    def _classify_error(self, error_msg, exception=None):
+        """Classify an error message as 'rate' (too fast), 'answered' (voted/closed) or 'other'"""
+        # Only Piazza's own error text is meaningful; a dropped connection must never
+        # mark a poll answered (that would skip it for good)
+        if isinstance(exception, TRANSPORT_ERRORS):
+            return "other"
+        # "Answered" wins so e.g. "already voted, please wait" is never retried as a rate limit
+        if ALREADY_VOTED_RE.search(error_msg):
+            return "answered"
+        if RATE_LIMIT_RE.search(error_msg):
+            return "rate"
+        return "other"
+    
+    def _rpc_call(self, func, *args, **kwargs):
+        """Send a request through the rate limiter, backing off only when Piazza pushes back"""
+        # Piazza pushes back either with HTTP 429 (raised as RateLimited by the
+        # session hook, honouring Retry-After) or with "too fast" in the JSON body
+        delay = 1
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire()
+            wait = delay
+            try:
+                response = func(*args, **kwargs)
+            except RateLimited as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES:
+                    raise
+                if e.retry_after is not None:
+                    wait = e.retry_after
+            except Exception as e:
+                if attempt == MAX_RATE_LIMIT_RETRIES or self._classify_error(str(e), e) != "rate":
+                    raise
+            else:
+                error = response.get('error') if isinstance(response, dict) else None
+                if attempt == MAX_RATE_LIMIT_RETRIES or not error or self._classify_error(str(error)) != "rate":
+                    return response
+            
+            self._emit([f"[{self._timestamp()}] Rate limit hit, backing off {wait:g} seconds..."])
+            self.rate_limiter.back_off(wait)
+            delay = min(delay * 2, MAX_BACKOFF)
+    
     def is_poll(self, post):
         """Check if a post is a poll"""
         try:
@@ -123,9 +424,9 @@ class PiazzaPollBot:
     def get_poll_details(self, post_id):
         """Fetch full poll details using get_post to get complete data"""
         try:
-            return self.network.get_post(post_id)
+            return self._rpc_call(self.network.get_post, post_id)
         except Exception as e:
-            print(f"[{self._timestamp()}] Error fetching full post details: {e}")
+            self._emit([f"[{self._timestamp()}] Error fetching full post details: {e}"])
             return None
     
     def is_poll_open(self, post):
@@ -144,13 +445,14 @@ class PiazzaPollBot:
             
         except Exception as e:
             print(f"[{self._timestamp()}] Error checking if poll is open: {e}")
-            import traceback
-            traceback.print_exc()
+            log.debug("Stack trace:", exc_info=True)
             return False
     
     def has_answered_poll(self, post):
         """Check if we've already answered this poll"""
-        return post['id'] in self.answered_polls
+        # Interning the lookup key too lets the set match on identity, since the
+        # stored IDs are interned
+        return sys.intern(post['id']) in self.answered_polls
     
     def has_user_voted(self, post):
         """Check if the current user has already voted in the poll"""
@@ -177,56 +479,75 @@ class PiazzaPollBot:
                     return question['answers']
             return None
         except Exception as e:
-            print(f"[{self._timestamp()}] Error getting poll options: {e}")
+            self._emit([f"[{self._timestamp()}] Error getting poll options: {e}"])
             return None
     
+    def _emit(self, lines):
+        """Write a batch of log lines with a single write (use this from worker threads)"""
+        with self._output_lock:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+    
+    def select_poll_option(self, options):
+        """Return the non-deleted options and the index of the one to vote for"""
+        active_options = [opt for opt in options if not opt.get('deleted', False)]
+        if not active_options:
+            return active_options, None
+        
+        # Use modulo to handle index out of range
+        return active_options, self.poll_answer_index % len(active_options)
+    
     def answer_poll(self, post):
         """Answer a poll using the correct API method"""
+        # Each poll's output is written in one go so parallel answers don't interleave
+        lines = []
         try:
             post_id = post['id']
             subject = post['history'][0].get('subject', 'Untitled Poll')
             
-            print(f"\n[{self._timestamp()}] ==========================================")
-            print(f"[{self._timestamp()}] Attempting to answer poll: {subject}")
-            print(f"[{self._timestamp()}] Post ID: {post_id}")
+            lines.append(f"\n[{self._timestamp()}] ==========================================")
+            lines.append(f"[{self._timestamp()}] Attempting to answer poll: {subject}")
+            lines.append(f"[{self._timestamp()}] Post ID: {post_id}")
             
             # Get poll options
             options = self.get_poll_options(post)
             
             if not options:
-                print(f"[{self._timestamp()}] Error: Could not find poll options")
-                self.answered_polls.add(post_id)
+                lines.append(f"[{self._timestamp()}] Error: Could not find poll options")
+                self._mark_answered(post_id)
+                self._emit(lines)
                 return False
             
-            # Filter out deleted options
-            active_options = [opt for opt in options if not opt.get('deleted', False)]
+            active_options, selected_index = self.select_poll_option(options)
             
             if not active_options:
-                print(f"[{self._timestamp()}] Error: No active options found")
-                self.answered_polls.add(post_id)
+                lines.append(f"[{self._timestamp()}] Error: No active options found")
+                self._mark_answered(post_id)
+                self._emit(lines)
                 return False
             
-            # Select the option (use modulo to handle index out of range)
-            selected_index = self.poll_answer_index % len(active_options)
             selected_option = active_options[selected_index]
             selected_id = selected_option['id']
             selected_text = selected_option['text']
             
-            print(f"[{self._timestamp()}] Available options:")
+            lines.append(f"[{self._timestamp()}] Available options:")
             for i, opt in enumerate(active_options):
                 marker = " <-- SELECTING THIS" if i == selected_index else ""
-                print(f"[{self._timestamp()}]   [{i}] {opt['text']} (ID: {opt['id']}){marker}")
+                lines.append(f"[{self._timestamp()}]   [{i}] {opt['text']} (ID: {opt['id']}){marker}")
             
             # Use the correct API format discovered from browser network inspection
-            print(f"[{self._timestamp()}] Submitting vote using content.vote API...")
+            lines.append(f"[{self._timestamp()}] Submitting vote using content.vote API...")
             
             # Add human-like delay before voting (2-5 seconds)
-            delay = random.uniform(2, 5)
-            print(f"[{self._timestamp()}] Waiting {delay:.1f} seconds before submitting (human-like delay)...")
+            delay = self._rng.uniform(2, 5)
+            lines.append(f"[{self._timestamp()}] Waiting {delay:.1f} seconds before submitting (human-like delay)...")
+            self._emit(lines)
+            lines = []
             time.sleep(delay)
             
             try:
-                response = self.rpc.request(
+                response = self._rpc_call(
+                    self.rpc.request,
                     method="content.vote",
                     data={
                         "cid": post_id,
@@ -236,123 +557,204 @@ class PiazzaPollBot:
                 
                 # Check if response indicates success
                 if response.get('error') is None:
-                    print(f"[{self._timestamp()}] !!!!!!!!!!!! Poll answered !!!!!!!!!!!!")
-                    print(f"[{self._timestamp()}] Selected option: {selected_text} (ID: {selected_id})")
+                    lines.append(f"[{self._timestamp()}] !!!!!!!!!!!! Poll answered !!!!!!!!!!!!")
+                    lines.append(f"[{self._timestamp()}] Selected option: {selected_text} (ID: {selected_id})")
                     
                     # Show vote results
                     result = response.get('result', {})
                     total_votes = result.get('total_votes', 'unknown')
-                    print(f"[{self._timestamp()}] Total votes on this poll: {total_votes}")
-                    print(f"[{self._timestamp()}] Response: {json.dumps(response, indent=2)[:500]}")
+                    lines.append(f"[{self._timestamp()}] Total votes on this poll: {total_votes}")
+                    if DEBUG:
+                        lines.append(f"[{self._timestamp()}] Response: {json.dumps({k: response.get(k) for k in ('result', 'error')})}")
                     
-                    self.answered_polls.add(post_id)
-                    print(f"[{self._timestamp()}] ==========================================\n")
+                    self._mark_answered(post_id)
+                    lines.append(f"[{self._timestamp()}] ==========================================\n")
+                    self._emit(lines)
                     return True
                 else:
-                    error = response.get('error', 'Unknown error')
-                    print(f"[{self._timestamp()}] ✗ Failed: {error}")
+                    error_msg = str(response.get('error', 'Unknown error'))
+                    lines.append(f"[{self._timestamp()}] ✗ Failed: {error_msg}")
                     
                     # Check if already voted
-                    if 'already' in str(error).lower() or 'voted' in str(error).lower():
-                        print(f"[{self._timestamp()}] Marking as answered (already voted)")
-                        self.answered_polls.add(post_id)
+                    if self._classify_error(error_msg) == "answered":
+                        lines.append(f"[{self._timestamp()}] Marking as answered (already voted)")
+                        self._mark_answered(post_id)
                     
-                    print(f"[{self._timestamp()}] ==========================================\n")
+                    lines.append(f"[{self._timestamp()}] ==========================================\n")
+                    self._emit(lines)
                     return False
                     
             except Exception as e:
-                error_msg = str(e).lower()
-                print(f"[{self._timestamp()}] ✗ Exception: {str(e)[:300]}")
+                error_msg = str(e)
+                lines.append(f"[{self._timestamp()}] ✗ Exception: {error_msg[:300]}")
                 
                 # Check if error indicates already voted or closed
-                if any(word in error_msg for word in ['already', 'voted', 'closed', 'expired']):
-                    print(f"[{self._timestamp()}] Marking as answered (already voted or closed)")
-                    self.answered_polls.add(post_id)
+                if self._classify_error(error_msg, e) == "answered":
+                    lines.append(f"[{self._timestamp()}] Marking as answered (already voted or closed)")
+                    self._mark_answered(post_id)
                 
-                print(f"[{self._timestamp()}] ==========================================\n")
+                lines.append(f"[{self._timestamp()}] ==========================================\n")
+                self._emit(lines)
                 return False
             
         except Exception as e:
-            error_msg = str(e).lower()
-            print(f"[{self._timestamp()}] Unexpected error answering poll {post_id}: {e}")
-            import traceback
-            traceback.print_exc()
+            error_msg = str(e)
+            lines.append(f"[{self._timestamp()}] Unexpected error answering poll {post_id}: {error_msg}")
+            if log.isEnabledFor(logging.DEBUG):
+                # Kept in this poll's batch rather than logged separately
+                lines.append(traceback.format_exc().rstrip())
             
             # Check if error indicates poll is closed or already voted
-            if any(word in error_msg for word in ['closed', 'expired', 'not accept', 'already voted', 'already answered']):
-                print(f"[{self._timestamp()}] Marking poll as answered (closed or already voted)")
-                self.answered_polls.add(post_id)
+            if self._classify_error(error_msg, e) == "answered":
+                lines.append(f"[{self._timestamp()}] Marking poll as answered (closed or already voted)")
+                self._mark_answered(post_id)
             
+            self._emit(lines)
             return False
     
+    def _partition(self, polls):
+        """Sort fully fetched polls into new, answered, voted and closed buckets"""
+        buckets = {'new': [], 'answered': [], 'voted': [], 'closed': []}
+        for post in polls:
+            if self.has_answered_poll(post):
+                buckets['answered'].append(post)
+            elif self.has_user_voted(post):
+                buckets['voted'].append(post)
+            elif not self.is_poll_open(post):
+                buckets['closed'].append(post)
+            else:
+                buckets['new'].append(post)
+        return buckets
+    
     def check_for_polls(self):
         """Check for new polls and answer them"""
+        # Anything posted from here on is news to the next wait_for_new_content
+        self.last_update_time = int(time.time())
+        self.last_check_started = time.monotonic()
         print(f"[{self._timestamp()}] Checking for new polls...")
         
         posts = self.get_all_posts()
         print(f"[{self._timestamp()}] Total posts retrieved: {len(posts)}")
+        self.known_content_ids = {post['id'] for post in posts}
         
-        polls_found = 0
-        new_polls_found = 0
-        closed_polls_skipped = 0
-        already_answered = 0
-        already_voted = 0
+        polls = [post for post in posts if self.is_poll(post)]
         
-        for post in posts:
-            if self.is_poll(post):
-                polls_found += 1
-                post_id = post['id']
-                subject = post['history'][0].get('subject', 'Untitled')
-                
-                print(f"\n[{self._timestamp()}] Found poll #{polls_found}: {subject} (ID: {post_id})")
-                
-                # Check status and config
-                status = post.get('status', 'unknown')
-                config = post.get('config', {})
-                poll_is_closed = config.get('poll_is_closed', 0)
-                
-                print(f"[{self._timestamp()}]   Status: {status}, poll_is_closed: {poll_is_closed}")
-                
-                if self.has_answered_poll(post):
-                    print(f"[{self._timestamp()}]   -> Already in answered list, skipping")
-                    already_answered += 1
-                    continue
-                
-                # Check if user has already voted
-                if self.has_user_voted(post):
-                    print(f"[{self._timestamp()}]   -> User has already voted, skipping")
-                    self.answered_polls.add(post['id'])
-                    already_voted += 1
-                    continue
-                
-                # Check if poll is still open
-                if not self.is_poll_open(post):
-                    print(f"[{self._timestamp()}]   -> Poll is closed, skipping")
-                    self.answered_polls.add(post['id'])
-                    closed_polls_skipped += 1
-                    continue
-                
-                print(f"[{self._timestamp()}]   -> This is a new, open poll! Attempting to answer...")
-                new_polls_found += 1
-                self.answer_poll(post)
-                
-                # Add random delay between polls to seem more human
-                if new_polls_found > 0:
-                    inter_poll_delay = random.uniform(2, 5)
-                    print(f"[{self._timestamp()}] Waiting {inter_poll_delay:.1f}s before checking next poll...")
-                    time.sleep(inter_poll_delay)
+        # The only poll/answered filter: split off answered polls using the feed
+        # summaries alone so only the rest cost a detail fetch, then sort the
+        # hydrated polls in a single pass
+        unanswered = [post for post in polls if not self.has_answered_poll(post)]
+        buckets = self._partition(self.hydrate_polls(unanswered))
+        already_answered = len(polls) - len(unanswered) + len(buckets['answered'])
+        
+        # Voted and closed polls never need checking again
+        for post in buckets['voted'] + buckets['closed']:
+            self._mark_answered(post['id'])
+        
+        ts = self._timestamp()
+        self._emit([
+            f"\n[{ts}] Summary:",
+            f"[{ts}]   Total polls found: {len(polls)}",
+            f"[{ts}]   New polls to answer: {len(buckets['new'])}",
+            f"[{ts}]   Already in answered list: {already_answered}",
+            f"[{ts}]   Already voted: {len(buckets['voted'])}",
+            f"[{ts}]   Closed polls: {len(buckets['closed'])}"
+        ])
+        
+        # Answer new polls in parallel; each vote still waits its own human-like
+        # delay, but the delays overlap instead of adding up
+        if buckets['new']:
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_FETCHES) as pool:
+                list(pool.map(self.answer_poll, buckets['new']))
+        
+        return len(buckets['new'])
+    
+    def _has_updates(self):
+        """Ask Piazza's update channel whether it lists content we haven't seen yet"""
+        response = self._rpc_call(
+            self.updates_rpc.request,
+            method="network.get_updates",
+            data={"since": self.last_update_time}
+        )
+        if response.get('error') is not None:
+            raise UpdateChannelError(response['error'])
+        
+        result = response.get('result') or []
+        if isinstance(result, dict):
+            result = result.get('feed', [])
+        
+        # The endpoint may ignore `since` and resend old content, so only IDs that
+        # weren't in the last feed and aren't already answered count as new
+        for item in result:
+            content_id = item.get('id') if isinstance(item, dict) else item
+            if (isinstance(content_id, str) and content_id not in self.known_content_ids
+                    and content_id not in self.answered_polls):
+                return True
+        return False
+    
+    def wait_for_new_content(self, timeout):
+        """Wait up to `timeout` seconds, returning True early if Piazza reports new content"""
+        deadline = time.monotonic() + timeout
         
-        print(f"\n[{self._timestamp()}] Summary:")
-        print(f"[{self._timestamp()}]   Total polls found: {polls_found}")
-        print(f"[{self._timestamp()}]   New polls to answer: {new_polls_found}")
-        print(f"[{self._timestamp()}]   Already in answered list: {already_answered}")
-        print(f"[{self._timestamp()}]   Already voted: {already_voted}")
-        print(f"[{self._timestamp()}]   Closed polls: {closed_polls_skipped}")
+        # Long-poll the update channel Piazza's web client uses until the deadline;
+        # if it isn't available we fall back to plain interval polling
+        while self.updates_supported:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            
+            call_started = time.monotonic()
+            self.updates_rpc.session.timeout = min(LONG_POLL_TIMEOUT, remaining)
+            try:
+                if self._has_updates():
+                    # Never start checks back to back, however often we're woken
+                    gap = self.last_check_started + MIN_CHECK_GAP - time.monotonic()
+                    if gap > 0:
+                        time.sleep(gap)
+                    return True
+            except TIMEOUT_ERRORS:
+                # Nothing arrived while the call was held open; ask again
+                continue
+            except UpdateChannelError as e:
+                print(f"[{self._timestamp()}] Update channel unavailable, using interval polling: {str(e)[:100]}")
+                self.updates_supported = False
+                break
+            except Exception as e:
+                # Transient trouble (connection reset, gateway error page, rate limit):
+                # sit out this interval only and try the channel again next time
+                print(f"[{self._timestamp()}] Update check failed, waiting for the next check: {str(e)[:100]}")
+                break
+            
+            if time.monotonic() - call_started >= LONG_POLL_HELD_THRESHOLD:
+                self.unheld_updates = 0
+            else:
+                self.unheld_updates += 1
+                if self.unheld_updates >= MAX_UNHELD_UPDATES:
+                    print(f"[{self._timestamp()}] Update channel isn't holding requests open, using interval polling")
+                    self.updates_supported = False
+                    break
+            
+            # Piazza answered without holding the request; space out the next call
+            pause = min(call_started + LONG_POLL_MIN_INTERVAL, deadline) - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
         
-        return new_polls_found
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        return False
     
     def run(self):
         """Main loop - continuously monitor for polls"""
+        # Root stays at WARNING so urllib3/httpx/hpack never dump headers (cookies,
+        # CSRF token); only the bot's own logger goes down to DEBUG
+        logging.basicConfig(
+            level=logging.WARNING,
+            stream=sys.stdout,
+            format="[%(asctime)s] %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"
+        )
+        log.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+        
         if not self.login():
             print("Failed to login. Exiting.")
             return
@@ -371,11 +773,12 @@ class PiazzaPollBot:
                 # Randomize check interval to avoid perfect timing patterns
                 # Use base interval +/- 25% random variation
                 variation = self.check_interval * 0.25
-                randomized_interval = self.check_interval + random.uniform(-variation, variation)
+                randomized_interval = self.check_interval + self._rng.uniform(-variation, variation)
                 
-                print(f"[{self._timestamp()}] Waiting {randomized_interval:.1f} seconds before next check...")
+                print(f"[{self._timestamp()}] Waiting up to {randomized_interval:.1f} seconds before next check...")
                 print(f"[{self._timestamp()}] (Base: {self.check_interval}s, Randomized: {randomized_interval:.1f}s)\n")
-                time.sleep(randomized_interval)
+                if self.wait_for_new_content(randomized_interval):
+                    print(f"[{self._timestamp()}] New content posted, checking now")
                 
         except KeyboardInterrupt:
             print(f"\n[{self._timestamp()}] Bot stopped by user.")